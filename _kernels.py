@@ -0,0 +1,81 @@
+'''
+@Author: Denver Cowan, Duke University. 2024
+
+The compiled numba kernels behind hot_hand_sim.py and process_csv.py. They live in their own module because numba's on-disk cache
+(cache=True) is thrown out whenever the file that defines a kernel changes, so keeping them out of the script means
+editing the simulations, analysis or plots does not cost another multi second compile on the next run.
+'''
+import numpy as np
+from numba import njit, prange
+
+@njit(cache=True)
+def fill_streak_lengths(shots: np.ndarray, lengths_out: np.ndarray) -> int:
+    '''
+    This function writes the length of every hit streak in shots into lengths_out in the order they happened.
+    a sequence of n shots has at most (n + 1) // 2 streaks, so lengths_out only has to be that long.
+    output: the number of streaks written
+    '''
+    streak = 0
+    count = 0
+    for shot in shots:
+        if shot == 1: # shot is a hit
+            streak += 1
+        elif streak > 0: # shot is a miss that ends a streak
+            lengths_out[count] = streak
+            count += 1
+            streak = 0
+    # handles streak at end of loop for example: [0,1,1,1]
+    if streak > 0:
+        lengths_out[count] = streak
+        count += 1
+
+    return count
+
+@njit(cache=True)
+def simulate_season_kernel(shooting_average: float, shots_taken: int, hist_out: np.ndarray) -> int:
+    '''
+    This function simulates a whole season in a single compiled pass: each shot is drawn, the current hit streak is counted,
+    and finished streaks are tallied straight into hist_out, where hist_out[k] is the number of hit streaks of length k.
+    hist_out needs room for shots_taken + 1 entries.
+    output: the total number of hit streaks in the season
+    '''
+    streak = 0
+    total_streaks = 0
+    for i in range(shots_taken):
+        if np.random.random() <= shooting_average: # shot is a hit
+            streak += 1
+        else: # shot is a miss
+            if streak > 0:
+                hist_out[streak] += 1
+                total_streaks += 1
+                streak = 0
+    # handles streak at end of season for example: [0,1,1,1]
+    if streak > 0:
+        hist_out[streak] += 1
+        total_streaks += 1
+
+    return total_streaks
+
+@njit(parallel=True, cache=True)
+def average_several_seasons_kernel(shooting_avg: float, shots_taken: int, trials: int, chunks: int, seed: int) -> np.ndarray:
+    '''
+    This function runs the simulated seasons in parallel. the trials are split into chunks, one per iteration of prange,
+    and every chunk adds the normalized streak length frequencies of its trials into its own row of a buffer so no two
+    threads ever write to the same memory.
+    if seed is non-negative trial t is seeded with seed + t, so every trial draws the same shots regardless of thread count.
+    the chunks follow the thread count though, so results from different thread counts can differ by float64 rounding.
+    output: array where entry k is the normalized frequency of hit streaks of length k, averaged over the trials
+    '''
+    per_chunk = np.zeros((chunks, shots_taken + 1))
+
+    for c in prange(chunks):
+        hist = np.zeros(shots_taken + 1, dtype=np.int64)
+        for t in range(c, trials, chunks):
+            if seed >= 0:
+                np.random.seed(seed + t)
+            hist[:] = 0
+            number_of_streaks = simulate_season_kernel(shooting_avg, shots_taken, hist)
+            if number_of_streaks > 0:
+                per_chunk[c] += hist / number_of_streaks
+
+    return per_chunk.sum(axis=0) / max(trials, 1)
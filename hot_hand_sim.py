@@ -1,98 +1,94 @@
 '''
 @Author: Denver Cowan, Duke University. 2024
 '''
-import random
-import matplotlib.pyplot as plt
 from collections import defaultdict
 import pandas as pd
 import numpy as np
+from numpy.random import Generator, SFC64
 from scipy.stats import ks_2samp
+from numba import get_num_threads
+from _kernels import fill_streak_lengths, simulate_season_kernel, average_several_seasons_kernel
 
 
 
+# generator for the numpy side of the simulation: single_shot, multiple_shots and average_several_seasons_geometric.
+# SFC64 produces 64 bit words faster than the default bit generator and still passes BigCrush.
+# the numba kernels behind simulate_season and average_several_seasons draw from numba's own np.random stream instead.
+rng = Generator(SFC64())
+
 def single_shot(shooting_average: float) -> int:
     '''Takes in a players shooting average and compares it to a randomly generated value between 0 and 1 for the sake of simulating a shot. 
     1 = hit
     0 = miss
     '''
-    random_value = random.random()
-    if random_value <= shooting_average:
-        return 1
-    else:
-        return 0
+    return int(rng.random() <= shooting_average)
 
-def multiple_shots(shooting_average: float, number_of_shots: int) -> list:
+def multiple_shots(shooting_average: float, number_of_shots: int) -> np.ndarray:
     '''
     this function simulates multiple shots taken in sequence by a player with a given shooting average.
-    output: list of hits and misses 
+    all of the random values are drawn at once instead of calling single_shot in a loop.
+    output: uint8 array of hits and misses 
     1 = hit
     0 = miss
     '''
-    result = []
-    for i in range(0, number_of_shots):
-        shot = single_shot(shooting_average)
-        result.append(shot)
-    return result
+    return (rng.random(number_of_shots) <= shooting_average).view(np.uint8)
 
-def hit_streak_lengths(shot_sequence: list) -> list:
+def hit_streak_lengths(shot_sequence: list) -> np.ndarray:
     '''
     This function determines the number of and length of made basket, or "hit" streaks in a sequence of shots
-    output: a list where each entry is a length of a hit streak. 
-    '''
-    result = []
-    streaking = False
-    count = len(shot_sequence)
-    current_hit_streak = 0
-
-    for shot in shot_sequence:
-        if shot == 1: # shot is a hit
-            if streaking == False:
-                streaking = True
-                current_hit_streak = 1
-            else:
-                current_hit_streak += 1
-        else: # shot is a miss
-            if streaking == True:
-                streaking = False
-                result.append(current_hit_streak)
-                current_hit_streak = 0
-    
-    # the code below is to handle the case where the player was still in a 
-    # streak at the end of the loop. for example: [0,1,1,1]
-    if streaking == True:
-        result.append(current_hit_streak)
-
-    return result
-
-def hit_streak_frequencies(hit_streak_lengths: list) -> list:
+    output: an array where each entry is a length of a hit streak. 
+    '''
+    shots = np.asarray(shot_sequence, dtype=np.uint8)
+    # the buffer is sized for the most streaks possible (alternating hits and misses) so it never has to grow
+    lengths = np.empty((shots.size + 1) // 2, dtype=np.int32)
+    count = fill_streak_lengths(shots, lengths)
+
+    return lengths[:count]
+
+def hit_streak_frequencies(hit_streak_lengths: list) -> np.ndarray:
     '''
     This function takes in a list of hit streak lengths, I.E. how many shots a player made in a row at different points in a season and outputs the frequency of hit streaks of that lenght
+    output: array where entry k is the number of hit streaks of length k
     '''
-    result = defaultdict(int)
+    return np.bincount(np.asarray(hit_streak_lengths, dtype=np.intp))
 
-    for hits_in_a_row in hit_streak_lengths:
-        result[hits_in_a_row] += 1
+def hist_to_samples(frequencies: list, total: int = None) -> np.ndarray:
+    '''
+    This function turns streak length frequencies, where entry k is for hit streaks of length k, back into the streak lengths they count.
+    I.E. [0, 2, 1] becomes [1, 1, 2]. tests like ks_2samp and the ecdf need the streaks themselves, not how often each length happened.
+    if total is given the frequencies are first rescaled to add up to that many streaks, which is how simulated (normalized) frequencies are compared to a real season.
+    '''
+    frequencies = np.asarray(frequencies, dtype=float)
+    # no streaks at all (I.E. a shooting average of 0) means there is nothing to rescale or repeat
+    if frequencies.sum() == 0:
+        return np.array([], dtype=int)
+    if total is not None:
+        frequencies = frequencies / frequencies.sum() * total
 
-    return result.values()
+    return np.repeat(np.arange(len(frequencies)), np.rint(frequencies).astype(int))
 
 def simulate_season(shooting_average: float, shots_taken: int) -> list:
     '''
     This function will generate a shot sequence for a given player with a
     specified shooting average and number of shots taken, determine hit streaks they got in that sequence, and then normalize those frequencies the normalized frequencies of those streaks is the return value.
+    entry i of the result is the normalized frequency of hit streaks of length i+1, up to the longest streak of the season.
     '''
-    shot_sequence = multiple_shots(shooting_average, shots_taken)
-    streak_lengths = hit_streak_lengths(shot_sequence)
-    number_of_streaks = len(streak_lengths)
-    frequency_of_streaks = hit_streak_frequencies(streak_lengths)
-    
-    normalized_frequencies = [freq / number_of_streaks for freq in frequency_of_streaks]
+    hist = np.zeros(shots_taken + 1, dtype=np.int64)
+    number_of_streaks = simulate_season_kernel(shooting_average, shots_taken, hist)
+    if number_of_streaks == 0:
+        return []
+
+    longest_streak = np.flatnonzero(hist)[-1]
+    normalized_frequencies = hist[1:longest_streak + 1] / number_of_streaks
 
-    return normalized_frequencies
+    return normalized_frequencies.tolist()
 
 def visualize_streaks(streak: list) -> None:
     '''
     This function takes in the results of a simulated season and visualizes them on a bar chart.
     '''
+    import matplotlib.pyplot as plt
+
     plt.bar(range(1, len(streak)+1),streak)
     plt.xlabel("Streak length")
     plt.ylabel('frequency')
@@ -104,6 +100,8 @@ def compare_two_players(p1_avg: float, p1_num_shots: int, p2_avg: float, p2_num_
     This function takes in two players shooting averages and number of shots taken respectively
     then generates the results of their seasons and visulizes them for comparison.
     '''
+    import matplotlib.pyplot as plt
+
     p1_shots = simulate_season(p1_avg, p1_num_shots)
     p2_shots = simulate_season(p2_avg, p2_num_shots)
 
@@ -121,114 +119,142 @@ def compare_two_players(p1_avg: float, p1_num_shots: int, p2_avg: float, p2_num_
     plt.tight_layout()
     plt.show()
 
-def average_several_seasons(shooting_avg: float, shots_taken: int, trials: int):
+def average_several_seasons(shooting_avg: float, shots_taken: int, trials: int, seed: int = -1) -> list:
     '''
     This function runs through several simulated seasons and adds up the normalized streak length frequencies from each season for that player and then returns the average.
     The purpose of this method is to allow us to get a better estimation of the expected value that a players streak length frequency will converge to as opposed to only running one simulation.
+    entry i of the result is for hit streaks of length i+1, up to the longest streak seen in any trial.
     '''
-    all_lists = []
-
-    for i in range(trials):
-        sim = simulate_season(shooting_avg, shots_taken)
-        all_lists.append(sim)
-
-    summed_values = [sum(values) for values in zip(*all_lists)]
-    return summed_values
-
-
-# simulating normally distributed shooting streaks for each player with the exact same shooting averages, and shots attempted as they had in their real season.
-
-deandre_jordan_simulated = average_several_seasons(0.71, 100000, 100) # id = 201599 
-# visualize_streaks(deandre_jordan)
-
-al_horford_simulated = average_several_seasons(0.54, 965, 100) # id = 2199
-#visualize_streaks(al_horford)
-
-brandan_wright_simulated = average_several_seasons(0.64, 726, 100) # id = 201148
-#visualize_streaks(brandan_wright)
-
-rudy_gobert_simulated = average_several_seasons(0.60, 427, 100) # id = 203497
-#visualize_streaks(rudy_gobert)
+    chunks = max(1, min(trials, get_num_threads()))
+    average_values = average_several_seasons_kernel(shooting_avg, shots_taken, trials, chunks, seed)
+    seen = np.flatnonzero(average_values)
+    if seen.size == 0:
+        return []
 
-andrea_bargnani_simulated = average_several_seasons(0.45, 361, 100) # id = 2730
-# print(andrea_bargnani)
-#visualize_streaks(andrea_bargnani)
+    return average_values[1:seen[-1] + 1].tolist()
 
-# reading in real player data
-csv_file_path = '/Users/denvercowan/player_streak_data.csv'
-actual_streak_data = pd.read_csv(csv_file_path)
-#print(actual_streak_data.head())
-
-# Initialize a dictionary to hold the data
-player_streak_frequencies = defaultdict(lambda: defaultdict(int))
-
-# Fill the dictionary with frequencies
-for _, row in actual_streak_data.iterrows():
-    player_id = row['player_id']
-    streak_length = int(row['streak_length'])
-    frequency = int(row['frequency'])
-    player_streak_frequencies[player_id][streak_length] = frequency
-
-# Now convert the nested defaultdict to a list format for each player
-player_streak_lists = {}
-for player_id, streaks in player_streak_frequencies.items():
-    max_streak_length = max(streaks.keys())
-    frequency_list = [0] * (max_streak_length + 1)  # Initialize the list with zeros
-    for length, freq in streaks.items():
-        frequency_list[length] = freq
-    player_streak_lists[player_id] = frequency_list
-
-deandre_jordan_actual = player_streak_lists[201599]
-al_horford_actual = player_streak_lists[2199]
-brandan_wright_actual = player_streak_lists[201148]
-rudy_gobert_actual = player_streak_lists[203497]
-andrea_bargnani_actual = player_streak_lists[2730]
-
-# Perform the Kolmogorov-Smirnov test for each player:
-# ks_stat_dj, p_value_dj = ks_2samp(deandre_jordan_actual, deandre_jordan_simulated)
-# print(f"K-S statistic dj: {ks_stat_dj}")
-# print(f"P-value dj: {p_value_dj}")
-
-# ks_stat_ah, p_value_ah = ks_2samp(al_horford_actual, al_horford_simulated)
-# print(f"K-S statistic AH: {ks_stat_ah}")
-# print(f"P-value AH: {p_value_ah}")
+def average_several_seasons_geometric(shooting_avg: float, shots_taken: int, trials: int) -> list:
+    '''
+    This function is a faster stand in for average_several_seasons that draws the streaks directly instead of every shot.
+    with independent shots a hit streak continues with probability shooting_avg, so its length is geometric:
+    P(streak = k) = shooting_avg^(k-1) * (1 - shooting_avg). a season has about shots_taken * p * (1 - p) streaks, so the number of
+    streaks in each trial is drawn from Binomial(shots_taken, p * (1 - p)) and then that many geometric lengths are drawn.
+    the only approximation is at the ends of the season (a streak can not run past the first or last shot), which moves
+    the frequencies by much less than the trial to trial noise for the season lengths we simulate.
+    output: same as average_several_seasons
+    '''
+    if shooting_avg <= 0 or shooting_avg >= 1:
+        return average_several_seasons(shooting_avg, shots_taken, trials)
 
-# ks_stat_bw, p_value_bw = ks_2samp(brandan_wright_actual, brandan_wright_simulated)
-# print(f"K-S statistic BW: {ks_stat_bw}")
-# print(f"P-value BW: {p_value_bw}")
+    streaks_per_trial = rng.binomial(shots_taken, shooting_avg * (1 - shooting_avg), size=trials)
+    lengths = np.minimum(rng.geometric(1 - shooting_avg, size=streaks_per_trial.sum()), shots_taken)
+    # every streak adds 1 / (streaks in its trial * trials), which averages the normalized frequencies of all trials at once
+    weights = np.repeat(1 / (np.maximum(streaks_per_trial, 1) * max(trials, 1)), streaks_per_trial)
+    average_values = np.bincount(lengths, weights=weights)
 
-# ks_stat_rg, p_value_rg = ks_2samp(rudy_gobert_actual, rudy_gobert_simulated)
-# print(f"K-S statistic RG: {ks_stat_rg}")
-# print(f"P-value RG: {p_value_rg}")
+    return average_values[1:].tolist()
 
-# ks_stat_bargnani, p_value_bargnani = ks_2samp(andrea_bargnani_actual, andrea_bargnani_simulated)
-# print(f"K-S statistic AB: {ks_stat_bargnani}")
-# print(f"P-value AB: {p_value_bargnani}")
+def ecdf(data, is_sorted: bool = False):
+    """Compute ECDF for a one-dimensional array of measurements.
+    pass is_sorted=True for data that is already in order (like the output of hist_to_samples) to skip the sort."""
+    # x-data for the ECDF: x
+    x = np.asarray(data) if is_sorted else np.sort(np.asarray(data))
 
-def ecdf(data):
-    """Compute ECDF for a one-dimensional array of measurements."""
     # Number of data points: n
-    n = len(data)
-
-    # x-data for the ECDF: x
-    x = np.sort(data)
+    n = x.size
 
     # y-data for the ECDF: y
-    y = np.arange(1, n+1) / n
+    y = np.arange(1, n + 1) / n
 
     return x, y
 
-# Generate ECDFs
-x_actual, y_actual = ecdf(andrea_bargnani_actual)
-x_sim, y_sim = ecdf(andrea_bargnani_simulated)
-
-# Plot the ECDFs
-plt.figure(figsize=(8, 5))
-plt.plot(x_actual, y_actual, marker='.', linestyle='none', label='Actual Data')
-plt.plot(x_sim, y_sim, marker='.', linestyle='none', color='red', label='Simulated Data')
-plt.xlabel('Streak Length')
-plt.ylabel('ECDF')
-plt.title('ECDF Comparison: Actual vs. Simulated Data')
-plt.legend()
-plt.grid(True)
-plt.show()
\ No newline at end of file
+def main() -> None:
+    '''
+    This function runs the whole comparison: it simulates each player, reads in their real streaks, runs the K-S test for each of them, and plots the ECDFs.
+    '''
+    # simulating normally distributed shooting streaks for each player with the exact same shooting averages, and shots attempted as they had in their real season.
+
+    deandre_jordan_simulated = average_several_seasons(0.71, 100000, 100) # id = 201599 
+    # visualize_streaks(deandre_jordan)
+
+    al_horford_simulated = average_several_seasons(0.54, 965, 100) # id = 2199
+    #visualize_streaks(al_horford)
+
+    brandan_wright_simulated = average_several_seasons(0.64, 726, 100) # id = 201148
+    #visualize_streaks(brandan_wright)
+
+    rudy_gobert_simulated = average_several_seasons(0.60, 427, 100) # id = 203497
+    #visualize_streaks(rudy_gobert)
+
+    andrea_bargnani_simulated = average_several_seasons(0.45, 361, 100) # id = 2730
+    # print(andrea_bargnani)
+    #visualize_streaks(andrea_bargnani)
+
+    # reading in real player data
+    csv_file_path = '/Users/denvercowan/player_streak_data.csv'
+    actual_streak_data = pd.read_csv(csv_file_path)
+    #print(actual_streak_data.head())
+
+    # Initialize a dictionary to hold the data
+    player_streak_frequencies = defaultdict(lambda: defaultdict(int))
+
+    # Fill the dictionary with frequencies
+    for _, row in actual_streak_data.iterrows():
+        player_id = row['player_id']
+        streak_length = int(row['streak_length'])
+        frequency = int(row['frequency'])
+        player_streak_frequencies[player_id][streak_length] = frequency
+
+    # Now convert the nested defaultdict to a list format for each player
+    player_streak_lists = {}
+    for player_id, streaks in player_streak_frequencies.items():
+        max_streak_length = max(streaks.keys())
+        frequency_list = [0] * (max_streak_length + 1)  # Initialize the list with zeros
+        for length, freq in streaks.items():
+            frequency_list[length] = freq
+        player_streak_lists[player_id] = frequency_list
+
+    # (name, actual frequencies, simulated frequencies) for every player we simulated.
+    # actual frequencies are indexed by streak length, simulated ones start at length 1 so a 0 is put in front.
+    players = [
+        ('dj', player_streak_lists[201599], [0] + deandre_jordan_simulated),
+        ('AH', player_streak_lists[2199], [0] + al_horford_simulated),
+        ('BW', player_streak_lists[201148], [0] + brandan_wright_simulated),
+        ('RG', player_streak_lists[203497], [0] + rudy_gobert_simulated),
+        ('AB', player_streak_lists[2730], [0] + andrea_bargnani_simulated),
+    ]
+
+    # Perform the Kolmogorov-Smirnov test for each player on the streak lengths themselves,
+    # with the simulated season scaled to the same number of streaks as the real one.
+    # the samples come out of hist_to_samples already sorted, so they are kept and reused for the ECDFs below.
+    # the asymptotic p-value is used since the exact distribution is very slow for seasons with thousands of streaks.
+    streak_samples = {}
+    for name, actual, simulated in players:
+        actual_samples = hist_to_samples(actual)
+        simulated_samples = hist_to_samples(simulated, total=actual_samples.size)
+        streak_samples[name] = (actual_samples, simulated_samples)
+
+        ks_stat, p_value = ks_2samp(actual_samples, simulated_samples, method='asymp')
+        print(f"K-S statistic {name}: {ks_stat}")
+        print(f"P-value {name}: {p_value}")
+
+    # Generate ECDFs
+    andrea_bargnani_actual_samples, andrea_bargnani_simulated_samples = streak_samples['AB']
+    x_actual, y_actual = ecdf(andrea_bargnani_actual_samples, is_sorted=True)
+    x_sim, y_sim = ecdf(andrea_bargnani_simulated_samples, is_sorted=True)
+
+    # Plot the ECDFs. matplotlib is only imported here since loading it is slow and nothing else needs it
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(8, 5))
+    plt.plot(x_actual, y_actual, marker='.', linestyle='none', label='Actual Data')
+    plt.plot(x_sim, y_sim, marker='.', linestyle='none', color='red', label='Simulated Data')
+    plt.xlabel('Streak Length')
+    plt.ylabel('ECDF')
+    plt.title('ECDF Comparison: Actual vs. Simulated Data')
+    plt.legend()
+    plt.grid(True)
+    plt.show()
+
+if __name__ == '__main__':
+    main()